@@ -1,4 +1,5 @@
 import time
+import asyncio
 import threading
 import numpy as np
 from caproto.server import pvproperty, PVGroup, ioc_arg_parser, run
@@ -16,6 +17,11 @@ class MyIOC(PVGroup):
     # Define z.VAL and z.RBV
     z_VAL = pvproperty(value=0.0, dtype=float, name="z.VAL")
     z_RBV = pvproperty(value=0.0, dtype=float, read_only=True, name="z.RBV")    
+    # Define a triggered counter, a peak in theta: write ACQ to count for PRE seconds, CNT increments when done
+    counter = pvproperty(value=0.0, read_only=True, name="counter")
+    counter_PRE = pvproperty(value=0.1, dtype=float, name="counter.PRE")
+    counter_ACQ = pvproperty(value=0, dtype=int, name="counter.ACQ")
+    counter_CNT = pvproperty(value=0, dtype=int, read_only=True, name="counter.CNT")
     @current_time.scan(period=1.0)  # Update every second
     async def current_time(self, instance, async_lib):
         """Update the current time PV."""
@@ -46,6 +52,20 @@ class MyIOC(PVGroup):
         # Update the RBV PV
         await self.z_RBV.write(rbv_value)
 
+    @counter_ACQ.putter
+    async def counter_ACQ(self, instance, value):
+        """When sim:counter.ACQ is set, count for the preset time and then bump sim:counter.CNT."""
+        if not value:
+            return 0
+        preset = self.counter_PRE.value
+        await asyncio.sleep(preset)
+        # Poisson counts of a Gaussian peak at theta = 5 degree on a flat background
+        rate = 1000 * np.exp(-((self.theta_RBV.value - 5) ** 2) / 2) + 50
+        await self.counter.write(float(np.random.poisson(rate * preset)))
+        await self.counter_CNT.write(self.counter_CNT.value + 1)
+        # Return to idle, ready for the next trigger
+        return 0
+
 if __name__ == "__main__":
     # Parse arguments for running the IOC
     ioc_options, run_options = ioc_arg_parser(
@@ -2,14 +2,20 @@ import sys
 import numpy as np
 import pandas as pd
 import openpyxl
+import os
 import json
 import epics
 import time
+import queue
+import threading
+import itertools
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 import PyQt5.QtCore as Qt
-from PyQt5.QtGui import QColor
 from scipy.optimize import curve_fit
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QLineEdit, QPushButton, QComboBox, QTableWidget, QTableWidgetItem, QHBoxLayout, QCheckBox, QMenuBar, QAction, QFileDialog, QMessageBox, QDialog, QRadioButton, QButtonGroup)
+    QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QLineEdit, QPushButton, QComboBox, QTableWidget, QTableWidgetItem, QTableView, QHBoxLayout, QCheckBox, QMenuBar, QAction, QFileDialog, QMessageBox, QDialog, QRadioButton, QButtonGroup)
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from PyQt5.QtCore import QTimer
@@ -30,6 +36,307 @@ def linear(x, slope, intercept):
 def lorentz(x, a, x0, gamma):
     return a / (1 + ((x - x0) / gamma) ** 2)
 
+# Index of the centre parameter of the peak and edge functions
+fit_center_index = {"Gaussian": 0, "Lorentz": 1, "Error function": 0}
+
+# Minimum time between refits and redraws during a scan, in seconds
+PLOT_INTERVAL = 0.2
+
+
+def downsample(y, width):
+    """Return the indices of the points worth drawing on `width` pixels: the min and max of each pixel column."""
+    n = len(y)
+    if n <= 2 * width:
+        return np.arange(n)
+    size = n // width
+    columns = np.asarray(y[:size * width]).reshape(width, size)
+    offsets = np.arange(width) * size
+    return np.unique(np.concatenate([offsets + columns.argmin(axis=1), offsets + columns.argmax(axis=1), np.arange(size * width, n)]))
+
+
+class RunningStats:
+    """Per-point running mean and variance with Welford updates."""
+
+    def __init__(self, num):
+        self.count = np.zeros(num, dtype=int)
+        self.mean = np.zeros(num)
+        self.m2 = np.zeros(num)
+
+    def update(self, k, value):
+        self.count[k] += 1
+        delta = value - self.mean[k]
+        self.mean[k] += delta / self.count[k]
+        self.m2[k] += delta * (value - self.mean[k])
+
+    def sem(self):
+        """Standard error of the mean, NaN for points measured less than twice."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1) / self.count), np.nan)
+
+
+# Table of the PVs offered in the dropdowns
+PV_TABLE_FILE = "./scan_pvs_table.xlsx"
+PV_TABLE_COLUMNS = ["Alias", "PV", "EGU", "Type"]
+PV_TYPES = ["Motor", "Detector"]
+# Optional columns of detectors acquired by trigger:
+#   Trigger     PV written with 1 to start counting
+#   Done        PV monitored to know when counting has finished
+#   Done Value  empty if Done is a counter, the point is done when it increments;
+#               otherwise the value of a busy/done flag when idle, the point is done when
+#               Done has left this value after the trigger and come back to it
+#   Preset      PV written with the count time
+PV_TRIGGER_COLUMNS = ["Trigger", "Done", "Done Value", "Preset"]
+
+
+def read_pv_table(file_name):
+    """Read a PV table from an Excel file in one pass into a DataFrame of strings."""
+    wb = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        rows = list(wb.active.iter_rows(values_only=True))
+    finally:
+        wb.close()
+    if not rows:
+        return pd.DataFrame(columns=PV_TABLE_COLUMNS)
+    pv_list = pd.DataFrame(rows[1:], columns=rows[0], dtype=object)
+    # Drop the blank columns and rows that only carry cell styles
+    pv_list = pv_list.loc[:, [name is not None for name in pv_list.columns]]
+    pv_list = pv_list.dropna(how="all").reset_index(drop=True)
+    return pv_list.fillna("").astype(str)
+
+
+def write_pv_table(pv_list, file_name):
+    """Write a PV table to an Excel file with a write-only workbook."""
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append([str(name) for name in pv_list.columns])
+    for row in pv_list.itertuples(index=False):
+        sheet.append(list(row))
+    wb.save(file_name)
+
+
+def validate_pv_table(pv_list):
+    """Return the list of problems that prevent using the table as the PV registry."""
+    missing = [name for name in PV_TABLE_COLUMNS if name not in pv_list.columns]
+    if missing:
+        return [f"Missing columns: {', '.join(missing)}"]
+    errors = []
+    aliases = pv_list["Alias"].str.strip()
+    for row in np.flatnonzero(aliases == ""):
+        errors.append(f"Row {row + 1}: empty Alias")
+    for alias in aliases[(aliases != "") & aliases.duplicated()].unique():
+        errors.append(f"Duplicated Alias: {alias}")
+    for row in np.flatnonzero(pv_list["PV"].str.strip() == ""):
+        errors.append(f"Row {row + 1}: empty PV")
+    for row in np.flatnonzero(~pv_list["Type"].isin(PV_TYPES)):
+        errors.append(f"Row {row + 1}: Type must be one of {', '.join(PV_TYPES)}")
+    if "Trigger" in pv_list.columns:
+        done = pv_list["Done"].str.strip() if "Done" in pv_list.columns else pd.Series("", index=pv_list.index)
+        for row in np.flatnonzero((pv_list["Trigger"].str.strip() != "") & (done == "")):
+            errors.append(f"Row {row + 1}: a Trigger PV needs a Done PV")
+    if "Done Value" in pv_list.columns:
+        done_values = pv_list["Done Value"].str.strip()
+        for row in np.flatnonzero(done_values != ""):
+            try:
+                float(done_values.iat[row])
+            except ValueError:
+                errors.append(f"Row {row + 1}: Done Value must be a number")
+    return errors
+
+
+class PvTableModel(Qt.QAbstractTableModel):
+    """Editable table model over a DataFrame of strings."""
+
+    def __init__(self, pv_list, parent=None):
+        super().__init__(parent)
+        self.pv_list = pv_list
+
+    def rowCount(self, parent=Qt.QModelIndex()):
+        return 0 if parent.isValid() else len(self.pv_list)
+
+    def columnCount(self, parent=Qt.QModelIndex()):
+        return 0 if parent.isValid() else len(self.pv_list.columns)
+
+    def data(self, index, role=Qt.Qt.DisplayRole):
+        if index.isValid() and role in (Qt.Qt.DisplayRole, Qt.Qt.EditRole):
+            return self.pv_list.iat[index.row(), index.column()]
+        return None
+
+    def setData(self, index, value, role=Qt.Qt.EditRole):
+        if not index.isValid() or role != Qt.Qt.EditRole:
+            return False
+        self.pv_list.iat[index.row(), index.column()] = str(value)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        return super().flags(index) | Qt.Qt.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.Qt.DisplayRole):
+        if role != Qt.Qt.DisplayRole:
+            return None
+        if orientation == Qt.Qt.Horizontal:
+            return str(self.pv_list.columns[section])
+        return str(section + 1)
+
+    def insertRows(self, row, count, parent=Qt.QModelIndex()):
+        self.beginInsertRows(parent, row, row + count - 1)
+        empty = pd.DataFrame([[""] * len(self.pv_list.columns)] * count, columns=self.pv_list.columns, dtype=object)
+        self.pv_list = pd.concat([self.pv_list.iloc[:row], empty, self.pv_list.iloc[row:]], ignore_index=True)
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=Qt.QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self.pv_list = self.pv_list.drop(self.pv_list.index[row:row + count]).reset_index(drop=True)
+        self.endRemoveRows()
+        return True
+
+
+# Address of the local scan control server
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = 5065
+# Number of most recent events kept for the clients
+CONTROL_MAX_EVENTS = 100000
+# Largest accepted scan, the point arrays of a scan are allocated up front
+MAX_SCAN_POINTS = 10 ** 7
+MAX_SCAN_REPEATS = 1000
+
+
+class ScanControlServer:
+    """Queue scan definitions and publish scan events as JSON over a localhost HTTP server."""
+
+    def __init__(self, validator, host=CONTROL_HOST, port=CONTROL_PORT):
+        self.validator = validator  # Turns a request body into a scan definition, raises ValueError
+        self.address = (host, port)
+        self.queue = queue.Queue()
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=CONTROL_MAX_EVENTS)
+        self.event_count = 0
+        self.next_id = 1
+        self.status = {"state": "idle", "scan": None, "index": 0, "num": 0, "queued": 0}
+        self.httpd = None
+
+    def start(self):
+        """Bind the HTTP server and serve requests from a daemon thread."""
+        self.httpd = ThreadingHTTPServer(self.address, ScanControlHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.control = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def submit(self, request):
+        """Validate a scan request and append it to the queue, returning the scan definition."""
+        definition = self.validator(request)
+        with self.condition:
+            definition["id"] = self.next_id
+            self.next_id += 1
+            self.queue.put(definition)
+            self.status["queued"] = self.queue.qsize()
+        self.publish({"event": "queued", "scan": definition})
+        return definition
+
+    def next_scan(self):
+        """Return the next queued scan definition, or None if the queue is empty."""
+        try:
+            definition = self.queue.get_nowait()
+        except queue.Empty:
+            return None
+        self.update_status(queued=self.queue.qsize())
+        return definition
+
+    def publish(self, event):
+        """Append an event to the log and wake up the streaming clients."""
+        with self.condition:
+            event["seq"] = self.event_count
+            self.events.append(event)
+            self.event_count += 1
+            self.condition.notify_all()
+
+    def update_status(self, **kwargs):
+        with self.condition:
+            self.status.update(kwargs)
+
+    def get_status(self):
+        with self.condition:
+            return dict(self.status, events=self.event_count)
+
+    def wait_events(self, since, timeout=1.0):
+        """Return the kept events from sequence number `since` on, waiting up to `timeout` for new ones."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.event_count > since, timeout)
+            first = self.event_count - len(self.events)
+            return list(itertools.islice(self.events, max(since - first, 0), None))
+
+
+class ScanControlHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON endpoints of the scan control server.
+
+    POST /scans          queue a scan definition
+    GET  /status         current state, scan and queue length
+    GET  /events?since=N stream events as newline-delimited JSON (follow=0 to return at once)
+    """
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        control = self.server.control
+        if urlparse(self.path).path != "/scans":
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            definition = control.submit(request)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(201, definition)
+
+    def do_GET(self):
+        control = self.server.control
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/status":
+            self.send_json(200, control.get_status())
+        elif url.path == "/events":
+            try:
+                since = int(query.get("since", ["0"])[0])
+            except ValueError as e:
+                self.send_json(400, {"error": f"Invalid since: {e}"})
+                return
+            follow = query.get("follow", ["1"])[0] != "0"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                while True:
+                    events = control.wait_events(since, timeout=1.0 if follow else 0)
+                    for event in events:
+                        self.wfile.write((json.dumps(event) + "\n").encode())
+                    self.wfile.flush()
+                    if events:
+                        since = events[-1]["seq"] + 1
+                    if not follow:
+                        break
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client went away
+        else:
+            self.send_json(404, {"error": "Unknown path %s" % self.path})
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for the scan output
+
 
 class DynamicPlot(QMainWindow):
     def __init__(self):
@@ -101,7 +408,12 @@ class DynamicPlot(QMainWindow):
         self.dropdown2 = QComboBox()
         scanning_layout.addWidget(self.dropdown2)
 
+        # Acquire each point by triggering the detector instead of waiting for the count time
+        self.triggered_checkbox = QCheckBox("Triggered")
+        scanning_layout.addWidget(self.triggered_checkbox)
+
         # Load data into the dropdown
+        self.pv_registry = {}
         self.load_excel_data()
 
         # Connect dropdown selection change to a method
@@ -160,16 +472,30 @@ class DynamicPlot(QMainWindow):
 
         layout.addWidget(self.scan_button)
 
+        # Local control server, the SCAN button is one of its clients
+        self.scan_timer = None
+        self.scanning = False
+        self.control_server = ScanControlServer(self.build_scan_definition)
+        try:
+            self.control_server.start()
+        except OSError as e:
+            print(f"Scan control server not started: {e}")
+
+        # Timer for starting the queued scans
+        self.queue_timer = QTimer(self)
+        self.queue_timer.timeout.connect(self.process_scan_queue)
+        self.queue_timer.start(200)
+
     def add_scan_parameters_table(self, layout):
         # Create a table with 2 rows and 6 columns
-        self.table = QTableWidget(2, 7)
-        self.table.setHorizontalHeaderLabels(["Start", "Middle", "End", "Step", "Num. of Points", "Time", "Selected"])
+        self.table = QTableWidget(2, 9)
+        self.table.setHorizontalHeaderLabels(["Start", "Middle", "End", "Step", "Num. of Points", "Time", "Repeats", "Center Err.", "Selected"])
         self.table.setVerticalHeaderLabels(["Parameter 1", "Parameter 2"])
 
         # Initialize table with default values
         default_values = [
-            ["0.000",  "5.000", "10.000", "1.000", "11", "0.500"],
-            ["0.000", "10.000", "20.000", "2.000", "11", "1.000"]
+            ["0.000",  "5.000", "10.000", "1.000", "11", "0.500", "1", "0.000"],
+            ["0.000", "10.000", "20.000", "2.000", "11", "1.000", "1", "0.000"]
         ]
 
         # List to store radio buttons
@@ -179,7 +505,7 @@ class DynamicPlot(QMainWindow):
         self.button_group = QButtonGroup(self)
 
         for row in range(2):
-            for col in range(6):
+            for col in range(8):
                 item = QTableWidgetItem(default_values[row][col])
                 self.table.setItem(row, col, item)
 
@@ -191,7 +517,7 @@ class DynamicPlot(QMainWindow):
             radio_widget = QWidget()
             radio_widget.setLayout(radio_layout)
 
-            self.table.setCellWidget(row, 6, radio_widget)
+            self.table.setCellWidget(row, 8, radio_widget)
 
             # Add the radio button to the list
             self.radio_buttons.append(radio_button)
@@ -355,15 +681,13 @@ class DynamicPlot(QMainWindow):
         """Load data from an Excel file into the dropdown."""
         try:
             # Load the Excel file
-            file_path = "./scan_pvs_table.xlsx"  # Replace with your Excel file path
-            self.pvList = pd.read_excel(file_path)
+            self.pvList = read_pv_table(PV_TABLE_FILE)
             print(self.pvList)
 
             # Check if the column 'alias' exists
             if "Alias" in self.pvList.columns:
                 # Populate the dropdown with unique values from the 'alias' column
-                self.dropdown1.addItems(self.pvList[self.pvList["Type"]=="Motor"]["Alias"].dropna().unique())
-                self.dropdown2.addItems(self.pvList[self.pvList["Type"]=="Detector"]["Alias"].dropna().unique())
+                self.refresh_pv_registry(self.pvList)
             else:
                 self.label1.setText("Column 'alias' not found in the Excel file.")
                 self.label2.setText("Column 'alias' not found in the Excel file.")
@@ -371,6 +695,36 @@ class DynamicPlot(QMainWindow):
             self.label1.setText(f"Error loading Excel file: {e}")
             self.label2.setText(f"Error loading Excel file: {e}")
 
+    def refresh_pv_registry(self, pv_list):
+        """Update the registry and the dropdowns in place from a PV table."""
+        pv_list = pv_list[pv_list["Alias"] != ""].drop_duplicates("Alias")
+        columns = PV_TABLE_COLUMNS + [name for name in PV_TRIGGER_COLUMNS if name in pv_list.columns]
+        registry = {row.pop("Alias"): row for row in pv_list[columns].to_dict("records")}
+        # Keep the same dict, the control server threads read it
+        for alias in set(self.pv_registry) - set(registry):
+            del self.pv_registry[alias]
+        self.pv_registry.update(registry)
+
+        self.sync_dropdown(self.dropdown1, [alias for alias, entry in registry.items() if entry["Type"] == "Motor"])
+        self.sync_dropdown(self.dropdown2, [alias for alias, entry in registry.items() if entry["Type"] == "Detector"])
+
+    def sync_dropdown(self, dropdown, aliases):
+        """Make the dropdown items match `aliases`, keeping the current selection when it is still listed."""
+        if [dropdown.itemText(n) for n in range(dropdown.count())] == aliases:
+            return
+        selected = dropdown.currentText()
+        dropdown.blockSignals(True)
+        try:
+            dropdown.clear()
+            dropdown.addItems(aliases)
+            if selected in set(aliases):
+                dropdown.setCurrentText(selected)
+        finally:
+            dropdown.blockSignals(False)
+        # Report a new selection if the old one was removed
+        if dropdown.currentText() != selected:
+            dropdown.currentTextChanged.emit(dropdown.currentText())
+
     def on_dropdown1_change(self, text):
         """Handle the dropdown selection change."""
         self.label1.setText(f"Selected motor: {text}")
@@ -384,19 +738,168 @@ class DynamicPlot(QMainWindow):
         """Update the plot with current data."""
         self.ax.clear()
         self.ax.set_title(self.data["label"])
-        self.ax.set_xlabel("%s (%s)"  % (self.text['motor'], self.pvList.loc[self.pvList["Alias"] == self.text["motor"], "EGU"].values[0]))
-        self.ax.set_ylabel("%s (%s)"  % (self.text['detector'], self.pvList.loc[self.pvList["Alias"] == self.text["detector"], "EGU"].values[0]))
-        self.ax.plot(self.data["x"], self.data["y"], "o-", label="Data")
+        self.ax.set_xlabel("%s (%s)"  % (self.text['motor'], self.pv_registry[self.text["motor"]]["EGU"]))
+        self.ax.set_ylabel("%s (%s)"  % (self.text['detector'], self.pv_registry[self.text["detector"]]["EGU"]))
+
+        # Draw at most a few points per pixel column of the axes, the whole range is visible at first
+        x, y = self.data["x"], self.data["y"]
+        steps = np.diff(x)
+        self.x_order = 1 if np.all(steps >= 0) else -1 if np.all(steps <= 0) else 0
+        self.data_range = (x.min(), x.max()) if len(x) else (0, 0)
+        self.has_errors = len(self.data.get("y_err", [])) == len(y) > 0
+        shown = downsample(y, self.plot_width())
+        label = "Data (%d passes)" % self.data["passes"] if self.has_errors else "Data"
+        self.data_line, = self.ax.plot(x[shown], y[shown], "o-", label=label)
+        self.error_bars = None
+        self.update_error_bars(shown)
+
+        # Fit curves are kept as parameters and evaluated over the visible range
+        self.fit_lines = {}
         for n in np.arange(len(self.checked_names)):
             checked_name = self.checked_names[n]
-            self.ax.plot(self.data[checked_name]["fit_x"], self.data[checked_name]["fit_y"], "-", label="%s Fitting" % checked_name)
+            self.fit_lines[checked_name], = self.ax.plot([], [], "-", label="%s Fitting" % checked_name)
+        self.update_fit_lines()
+        self.ax.callbacks.connect("xlim_changed", self.on_xlim_changed)
         self.ax.legend()
         self.canvas.draw()
 
+    def plot_width(self):
+        """Width of the axes in pixels."""
+        return max(int(self.ax.bbox.width), 1)
+
+    def update_fit_lines(self):
+        """Evaluate the fitted functions at screen resolution over the visible part of the data."""
+        left, right = sorted(self.ax.get_xlim())
+        x_fine_values = np.linspace(max(left, self.data_range[0]), min(right, self.data_range[1]), self.plot_width())
+        for checked_name, line in self.fit_lines.items():
+            popt = self.data[checked_name]["optimized values"]
+            if len(popt) and len(self.data["x"]) > 1:
+                line.set_data(x_fine_values, self.function_map[checked_name](x_fine_values, *popt))
+            else:
+                line.set_data([], [])
+
+    def update_error_bars(self, shown):
+        """Draw the error bars of the shown data points."""
+        if self.error_bars is not None:
+            self.error_bars.remove()
+            self.error_bars = None
+        if self.has_errors:
+            self.error_bars = self.ax.errorbar(self.data["x"][shown], self.data["y"][shown], yerr=self.data["y_err"][shown],
+                                               fmt="none", ecolor=self.data_line.get_color())
+
+    def visible_points(self):
+        """Return the indices of the data points inside the visible x-range, downsampled to the axes width."""
+        x, y = self.data["x"], self.data["y"]
+        left, right = sorted(self.ax.get_xlim())
+        if self.x_order != 0:
+            # Monotonic scans: bisect for the window, keeping one point beyond each edge
+            if self.x_order > 0:
+                start, stop = np.searchsorted(x, left), np.searchsorted(x, right, side="right")
+            else:
+                start, stop = len(x) - np.searchsorted(x[::-1], right, side="right"), len(x) - np.searchsorted(x[::-1], left)
+            start, stop = max(start - 1, 0), min(stop + 1, len(x))
+            return start + downsample(y[start:stop], self.plot_width())
+        window = np.flatnonzero((x >= left) & (x <= right))
+        return window[downsample(y[window], self.plot_width())]
+
+    def on_xlim_changed(self, ax):
+        """Re-sample the data and re-evaluate the fit curves when the visible range changes."""
+        shown = self.visible_points()
+        self.data_line.set_data(self.data["x"][shown], self.data["y"][shown])
+        self.update_error_bars(shown)
+        self.update_fit_lines()
+        self.canvas.draw_idle()
+
     def scan(self):
+        """Queue a scan with the parameters of the selected table row."""
+        # Read the current values for calculation
+        # Check which radio button is selected
+        for row, radio_button in enumerate(self.radio_buttons):
+            if radio_button.isChecked():
+                request = {
+                    "motor": self.text["motor"],
+                    "detector": self.text["detector"],
+                    "start": self.table.item(row, 0).text(),
+                    "end": self.table.item(row, 2).text(),
+                    "num": self.table.item(row, 4).text(),
+                    "time": self.table.item(row, 5).text(),
+                    "repeats": self.table.item(row, 6).text(),
+                    "tolerance": self.table.item(row, 7).text(),
+                    "triggered": self.triggered_checkbox.isChecked(),
+                    "fitting": [name for name, checkbox in self.checkboxes.items() if checkbox.isChecked()],
+                }
+                try:
+                    definition = self.control_server.submit(request)
+                except ValueError as e:
+                    self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:red;'>Invalid scan parameters: {e}")
+                    return
+                if self.scanning:
+                    self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scan {definition['id']} queued, parameter {row+1} is selected.")
+                self.process_scan_queue()
+
+    def build_scan_definition(self, request):
+        """Check a scan request against the PV table and return a clean scan definition."""
+        if not isinstance(request, dict):
+            raise ValueError("Scan request must be a JSON object")
+        definition = {}
+        for key, pv_type in (("motor", "Motor"), ("detector", "Detector")):
+            alias = request.get(key)
+            if not isinstance(alias, str) or self.pv_registry.get(alias, {}).get("Type") != pv_type:
+                raise ValueError(f"Unknown {key} alias: {alias}")
+            definition[key] = alias
+        try:
+            definition["start"] = float(request["start"])
+            definition["end"] = float(request["end"])
+            definition["num"] = int(float(request["num"]))
+            definition["time"] = float(request.get("time", 0.5))
+            definition["repeats"] = int(float(request.get("repeats", 1)))
+            definition["tolerance"] = float(request.get("tolerance", 0))
+        except KeyError as e:
+            raise ValueError(f"Missing scan parameter: {e.args[0]}")
+        except (TypeError, ValueError, OverflowError) as e:
+            raise ValueError(f"Invalid scan parameter: {e}")
+        for key in ("start", "end", "time", "tolerance"):
+            if not np.isfinite(definition[key]):
+                raise ValueError(f"Scan parameter {key} must be finite")
+        if not 1 <= definition["num"] <= MAX_SCAN_POINTS:
+            raise ValueError(f"Number of points must be between 1 and {MAX_SCAN_POINTS}")
+        if not 1 <= definition["repeats"] <= MAX_SCAN_REPEATS:
+            raise ValueError(f"Number of repeats must be between 1 and {MAX_SCAN_REPEATS}")
+        fitting = request.get("fitting", [])
+        if not isinstance(fitting, list) or not all(isinstance(name, str) for name in fitting):
+            raise ValueError("Fitting functions must be a list of names")
+        unknown = [name for name in fitting if name not in self.function_map]
+        if unknown:
+            raise ValueError(f"Unknown fitting functions: {unknown}")
+        definition["fitting"] = list(fitting)
+        definition["triggered"] = bool(request.get("triggered", False))
+        if definition["triggered"] and not (self.pv_registry[definition["detector"]].get("Trigger") and self.pv_registry[definition["detector"]].get("Done")):
+            raise ValueError(f"Detector {definition['detector']} has no Trigger and Done PVs")
+        return definition
+
+    def process_scan_queue(self):
+        """Start the next queued scan when no scan is running."""
+        if self.scanning:
+            return
+        definition = self.control_server.next_scan()
+        if definition is not None:
+            self.start_scan(definition)
+
+    def start_scan(self, definition):
+        """Perform motor scan, record detector and update the plot."""
+        self.scan_id = definition["id"]
+        self.triggered = definition["triggered"]
+        if self.triggered:
+            try:
+                self.connect_trigger(self.pv_registry[definition["detector"]], definition["time"])
+            except (TimeoutError, ValueError, epics.ca.ChannelAccessException) as e:
+                self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:red;'>Error starting triggered scan: {e}")
+                self.control_server.publish({"event": "error", "id": self.scan_id, "error": str(e)})
+                return
+        self.scanning = True
 
         # Display the message as scanning 
-        self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scanning ...")
+        self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scanning... scan {self.scan_id}")
 
         # Re-Initialize crosshair points and artists
         self.left_cross = None  # Position of left crosshair
@@ -405,95 +908,218 @@ class DynamicPlot(QMainWindow):
         self.right_marker = None  # Matplotlib artist for right crosshair
         self.middle_marker = None  # Matplotlib artist for the middle point
 
-        
-        # Read the current values for calculation
-        # Check which radio button is selected
-        for row, radio_button in enumerate(self.radio_buttons):
-            if radio_button.isChecked():
-                self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scanning... Parameter {row+1} is selected.")
-                """Perform motor scan, record detector and update the plot."""
-                # Timer for updating random data
-                self.current_index = 0
-                # Data for the plot
-                self.data = {"x": [], "y": [], "label": self.text["motor"]}
-
-                """List all checked checkboxes."""
-                self.checked_names = [name for name, checkbox in self.checkboxes.items() if checkbox.isChecked()]
-                for n in np.arange(len(self.checked_names)):
-                    self.data[self.checked_names[n]] = {"fit_x": [], "fit_y": [], "optimized values":[]}
-                self.start = float(self.table.item(row, 0).text())
-                self.middle = float(self.table.item(row, 1).text())
-                self.end = float(self.table.item(row, 2).text())
-                self.step = float(self.table.item(row, 3).text())
-                self.num = int(float(self.table.item(row, 4).text()))
-                self.accu = float(self.table.item(row, 5).text())
-                self.scanPos = np.linspace(self.start, self.end, self.num)
-
-                self.scan_timer = QTimer(self)
-                self.scan_timer.timeout.connect(self.update_scan_step)
-                self.scan_timer.start(500)  # Update every 1 second
+        # Follow the motor and detector of the scan in the dropdowns
+        self.dropdown1.setCurrentText(definition["motor"])
+        self.dropdown2.setCurrentText(definition["detector"])
+        self.text = {"motor": definition["motor"], "detector": definition["detector"]}
+
+        self.current_index = 0
+        self.last_draw = 0
+        self.draw_interval = PLOT_INTERVAL
+        # Data for the plot
+        self.data = {"x": np.zeros(0), "y": np.zeros(0), "label": self.text["motor"]}
+
+        self.checked_names = definition["fitting"]
+        for n in np.arange(len(self.checked_names)):
+            self.data[self.checked_names[n]] = {"optimized values":[]}
+        self.start = definition["start"]
+        self.end = definition["end"]
+        self.num = definition["num"]
+        self.middle = (self.start + self.end) / 2
+        self.step = (self.end - self.start) / (self.num - 1) if self.num > 1 else self.end - self.start
+        self.accu = definition["time"]
+        self.repeats = definition["repeats"]
+        self.tolerance = definition["tolerance"]  # Stop once the fitted centres are known better than this
+        self.scanPos = np.linspace(self.start, self.end, self.num)
+
+        # Running statistics of every scan point over the passes
+        self.x_stats = RunningStats(self.num)
+        self.y_stats = RunningStats(self.num)
+        self.converged = False
+
+        self.control_server.update_status(state="scanning", scan=definition, index=0, num=self.num * self.repeats)
+        self.control_server.publish({"event": "started", "scan": definition})
+
+        self.scan_timer = QTimer(self)
+        self.scan_timer.timeout.connect(self.update_scan_step)
+        # Triggered points follow each other as soon as the event loop is free
+        self.scan_timer.start(0 if self.triggered else 500)  # Update every 0.5 second
+
+    def connect_trigger(self, detector, count_time):
+        """Monitor the Done PV of a triggered detector and set its count time."""
+        self.trigger_pv = detector["Trigger"]
+        # None waits for the Done counter to increment, a number for the Done flag to return to it
+        self.done_value = float(detector["Done Value"]) if detector.get("Done Value") else None
+        self.acquire_values = queue.Queue()
+        self.done_pv = epics.PV(detector["Done"], callback=self.on_acquire_done)
+        try:
+            if not self.done_pv.wait_for_connection(timeout=4):
+                raise TimeoutError(f"Timeout connecting to {detector['Done']}")
+            self.acquire_count = self.done_pv.get(timeout=4)
+            if self.acquire_count is None:
+                raise TimeoutError(f"Timeout reading {detector['Done']}")
+            if detector.get("Preset"):
+                epics.caput(detector["Preset"], count_time, wait=True, timeout=4)
+        except Exception:
+            self.done_pv.clear_callbacks()
+            self.done_pv.disconnect()
+            raise
+
+    def on_acquire_done(self, value=None, **kwargs):
+        """Monitor callback of the Done PV, called from the Channel Access thread."""
+        self.acquire_values.put(value)
+
+    def check_done_value(self, value):
+        """Raise a Channel Access error for the None sent by the Done PV monitor on disconnection."""
+        if value is None:
+            raise epics.ca.ChannelAccessException(f"Lost connection to {self.done_pv.pvname}")
+        self.acquire_count = value
+
+    def acquire_point(self, detector_pv):
+        """Trigger the detector, wait for the Done PV to report the end of counting and read the detector."""
+        # Drop the updates from before the trigger
+        while not self.acquire_values.empty():
+            self.check_done_value(self.acquire_values.get_nowait())
+        previous = self.acquire_count
+        busy = False
+        epics.caput(self.trigger_pv, 1, timeout=4)
+        deadline = time.monotonic() + self.accu + 4
+        while True:
+            try:
+                value = self.acquire_values.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"Timeout waiting for {self.done_pv.pvname}")
+            self.check_done_value(value)
+            if self.done_value is None:
+                if value > previous:
+                    break  # The counter has incremented
+            elif float(value) != self.done_value:
+                busy = True  # Counting has started
+            elif busy:
+                break  # Back to the done value after counting
+        return epics.caget(detector_pv, timeout=4)
+
+    def finish_scan(self, event):
+        """Stop the scan timer and report the end of the scan to the control clients."""
+        self.scan_timer.stop()
+        self.scanning = False
+        if self.triggered:
+            self.done_pv.clear_callbacks()
+            self.done_pv.disconnect()
+        event["id"] = self.scan_id
+        self.control_server.update_status(state="idle", scan=None)
+        self.control_server.publish(event)
 
     def update_scan_step(self):
         """Update the plot for each step during 1d scan."""
 
         # Incrementally process data
         i = self.current_index
-        if i >= self.num:
-            self.scan_timer.stop()  # Stop the timer when all data is processed
+        if i >= self.num * self.repeats or self.converged:
+            # Stop the timer when all data is processed
+            passes = int(np.ceil(i / self.num))
+            self.finish_scan({"event": "finished", "passes": passes, "fits": {name: self.data[name]["optimized values"] for name in self.checked_names}})
 
             # Display the message as scanning 
-            self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scan finished!")
+            self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:green;'>Scan finished after {passes} pass(es)!")
 
             # Display optimized value
             self.optimized_input.setText("%s" % [[self.checked_names[n], self.data[self.checked_names[n]]['optimized values']] for n in np.arange(len(self.checked_names))])
 
             return
 
+        # Alternate the direction of the passes to avoid backlash travel
+        scan_pass, k = divmod(i, self.num)
+        if scan_pass % 2 == 1:
+            k = self.num - 1 - k
+
         try:
             # Update the data to the current step
-            motor_pv = self.pvList.loc[self.pvList["Alias"] == self.text["motor"], "PV"].values[0]+".VAL"
-            epics.caput(motor_pv, self.scanPos[i], timeout=4) 
-            time.sleep(self.accu * 0.1)  # Allow time for movement
+            motor_pv = self.pv_registry[self.text["motor"]]["PV"]+".VAL"
+            if self.triggered:
+                epics.caput(motor_pv, self.scanPos[k], wait=True, timeout=30)  # Wait for the move to complete
+            else:
+                epics.caput(motor_pv, self.scanPos[k], timeout=4) 
+                time.sleep(self.accu * 0.1)  # Allow time for movement
 
             # Read the motor position
             motor_rbv = motor_pv.replace(".VAL", ".RBV")
             motor_position = epics.caget(motor_rbv, timeout=4)
             if motor_position is None:
                 raise TimeoutError(f"Timeout reading motor position from {motor_rbv}")
-            self.data["x"].append(motor_position)
-
-            # Count  detector for accumulate time
-            time.sleep(self.accu)
 
-            detector_pv = self.pvList.loc[self.pvList["Alias"] == self.text["detector"], "PV"].values[0]
-            detector_value = epics.caget(detector_pv, timeout=4)
+            detector_pv = self.pv_registry[self.text["detector"]]["PV"]
+            if self.triggered:
+                detector_value = self.acquire_point(detector_pv)
+            else:
+                # Count  detector for accumulate time
+                time.sleep(self.accu)
+                detector_value = epics.caget(detector_pv, timeout=4)
             if detector_value is None:
                 raise TimeoutError(f"Timeout reading detector value from {detector_pv}")
-            self.data["y"].append(detector_value)
+            self.control_server.publish({"event": "point", "id": self.scan_id, "index": i, "pass": scan_pass, "point": k, "x": float(motor_position), "y": float(detector_value)})
+
+            # Average the passes point by point
+            self.x_stats.update(k, motor_position)
+            self.y_stats.update(k, detector_value)
+            # The first pass runs forward, so its measured points are a prefix of the running means
+            measured = slice(0, k + 1) if scan_pass == 0 else slice(None)
+            self.data["x"] = self.x_stats.mean[measured]
+            self.data["y"] = self.y_stats.mean[measured]
+            self.data["passes"] = scan_pass + 1
+
+            # Refit and redraw at the end of every pass, otherwise wait at least PLOT_INTERVAL
+            # and twice the time the last refit took, so the GUI stays responsive on long scans
+            last_of_pass = (i + 1) % self.num == 0
+            if not last_of_pass and time.monotonic() - self.last_draw < self.draw_interval:
+                self.current_index += 1
+                self.control_server.update_status(index=self.current_index)
+                return
+            draw_start = time.monotonic()
+            self.data["y_err"] = self.y_stats.sem()[measured] if scan_pass > 0 else np.zeros(0)
 
             if i > 1:
+                # Weight the averaged points once every point has been measured three times,
+                # a two-sample standard error is too noisy to trust as a weight
+                sigma = self.data["y_err"]
+                if not (len(sigma) and np.all(self.y_stats.count >= 3) and np.all(sigma > 0)):
+                    sigma = None
+                center_errors = []
+                all_fitted = True
                 # Fit to any function for the current data slice
                 try:
                     for n in np.arange(len(self.checked_names)):
                         checked_name = self.checked_names[n]
-                        popt, _ = curve_fit(self.function_map[checked_name], self.data['x'], self.data['y'])
+                        # Repeats add passes, not distinct points: a fit needs at least one point per parameter
+                        if len(self.data["x"]) < self.function_map[checked_name].__code__.co_argcount - 1:
+                            all_fitted = False
+                            continue
+                        popt, pcov = curve_fit(self.function_map[checked_name], self.data['x'], self.data['y'], sigma=sigma, absolute_sigma=False)
                         #popt, _ = curve_fit(self.function_map[checked_name], self.data['x'], self.data['y'], p0=[0, 0.1, 1])
                         self.data[checked_name]["optimized values"] = list(popt)  # Save the best fitting value
-                        self.x_fine_values = np.linspace(self.data['x'][0], self.data['x'][-1], len(self.data['x']) * 10)
-                        self.data[checked_name]["fit_x"], self.data[checked_name]["fit_y"] = list(self.x_fine_values), list(self.function_map[checked_name](self.x_fine_values, *popt))
-                except RuntimeError:
-                    pass  # Ignore fitting errors for small data points
-            else:
-                self.data["fit_x"], self.data["fit_y"] = [], []
+                        if checked_name in fit_center_index:
+                            center = fit_center_index[checked_name]
+                            center_errors.append(np.sqrt(pcov[center, center]))
+                            self.data[checked_name]["center error"] = float(center_errors[-1])
+                        self.control_server.publish({"event": "fit", "id": self.scan_id, "index": i, "function": checked_name, "values": [float(v) for v in popt]})
+                except (RuntimeError, TypeError, ValueError):
+                    all_fitted = False  # Ignore fitting errors for small data points
+
+                # Stop early at the end of a pass once every fitted centre is precise enough
+                if last_of_pass and scan_pass > 0 and self.tolerance > 0 and all_fitted and center_errors:
+                    self.converged = all(error < self.tolerance for error in center_errors)
             
             # Save the PV and EGU information
             self.data["scan"], self.data["fitting"] = self.text, self.checked_names 
 
             # Update the plot
             self.update_plot()
+            self.last_draw = time.monotonic()
+            self.draw_interval = max(PLOT_INTERVAL, 2 * (self.last_draw - draw_start))
 
             # Move to the next data point
             self.current_index += 1
+            self.control_server.update_status(index=self.current_index)
 
             #print(self.data['x'])
 
@@ -502,9 +1128,14 @@ class DynamicPlot(QMainWindow):
             # Handle timeout or EPICS communication errors
 
             self.msglabel1.setText(f"<span style='font-size:16pt; font-weight:bold; color:red;'>Error during scan step: {e}")
-            self.scan_timer.stop()  # Stop the scan
+            self.finish_scan({"event": "error", "error": str(e)})  # Stop the scan
             return 
 
+    def closeEvent(self, event):
+        """Shut down the control server with the window."""
+        self.control_server.stop()
+        super().closeEvent(event)
+
     def create_menu_bar(self):
         """Create the menu bar with File and Edit options."""
         menu_bar = self.menuBar()
@@ -538,9 +1169,18 @@ class DynamicPlot(QMainWindow):
         file_name, _ = QFileDialog.getSaveFileName(self, "Save Data", "", "CSV Files (*.json);;All Files (*)", options=options)
         if file_name:
             try:
-                # Write the dictionary to the selected file in JSON format
+                # Write the raw arrays next to the JSON file, so they can be memory-mapped when loaded
+                columns = {"x": self.data["x"], "y": self.data["y"]}
+                if len(self.data.get("y_err", [])) == len(self.data["y"]) > 0:
+                    columns["y_err"] = self.data["y_err"]
+                raw_name = os.path.splitext(file_name)[0] + ".npy"
+                np.save(raw_name, np.column_stack(list(columns.values())).astype(float))
+
+                # Write the rest of the dictionary to the selected file in JSON format
+                metadata = {key: value for key, value in self.data.items() if key not in ("x", "y", "y_err")}
+                metadata["raw"] = {"file": os.path.basename(raw_name), "columns": list(columns)}
                 with open(file_name, 'w') as f:
-                    json.dump(self.data, f, indent=4)
+                    json.dump(metadata, f, indent=4)
                 QMessageBox.information(self, "Save Data", f"Data successfully saved to {file_name}")
             except Exception as e:
                 QMessageBox.warning(self, "Save Data", f"Error saving data: {str(e)}")
@@ -563,6 +1203,17 @@ class DynamicPlot(QMainWindow):
                 with open(file_name, 'r') as file:
                     loaded_data = json.load(file)
                 
+                # Map the raw arrays instead of reading them into memory
+                if "raw" in loaded_data:
+                    raw = np.load(os.path.join(os.path.dirname(file_name), loaded_data["raw"]["file"]), mmap_mode="r")
+                    for n, column in enumerate(loaded_data["raw"]["columns"]):
+                        loaded_data[column] = raw[:, n]
+                else:
+                    # Older files keep the data as JSON lists
+                    for column in ("x", "y", "y_err"):
+                        if column in loaded_data:
+                            loaded_data[column] = np.asarray(loaded_data[column], dtype=float)
+
                 # Update self.data with loaded data
                 self.data = loaded_data
 
@@ -574,21 +1225,11 @@ class DynamicPlot(QMainWindow):
 
     def load_plot(self):
         """Update the plot with current data."""
-        self.ax.clear()
-        
         # Reload the json files to the variables
         self.text = self.data["scan"]
         self.checked_names = self.data["fitting"]
 
-        self.ax.set_title(self.data["label"])
-        self.ax.set_xlabel("%s (%s)"  % (self.text['motor'], self.pvList.loc[self.pvList["Alias"] == self.text["motor"], "EGU"].values[0]))
-        self.ax.set_ylabel("%s (%s)"  % (self.text['detector'], self.pvList.loc[self.pvList["Alias"] == self.text["detector"], "EGU"].values[0]))
-        self.ax.plot(self.data["x"], self.data["y"], "o-", label="Data")
-        for n in np.arange(len(self.checked_names)):
-            checked_name = self.checked_names[n]
-            self.ax.plot(self.data[checked_name]["fit_x"], self.data[checked_name]["fit_y"], "-", label="%s Fitting" % checked_name)
-        self.ax.legend()
-        self.canvas.draw()
+        self.update_plot()
 
     def edit_excel_file(self):
         """Edit the Excel file."""
@@ -598,20 +1239,19 @@ class DynamicPlot(QMainWindow):
         
         if file_name:
             try:
-                # Load the Excel file using openpyxl
-                wb = openpyxl.load_workbook(file_name)
-                sheet = wb.active
+                # Load the whole Excel sheet in one pass
+                pv_list = read_pv_table(file_name)
 
                 # Show a message box to confirm the file loading
                 QMessageBox.information(self, "Edit Excel", f"Opened Excel file: {file_name}")
                 
                 # Show the dialog box for editing Excel content
-                self.show_table_edit_dialog(wb, sheet, file_name)
+                self.show_table_edit_dialog(pv_list, file_name)
 
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"Error opening the Excel file: {e}")
 
-    def show_table_edit_dialog(self, wb, sheet, file_name):
+    def show_table_edit_dialog(self, pv_list, file_name):
         """Show a dialog with a table to edit the Excel content."""
         dialog = QDialog(self)
         dialog.setWindowTitle("Edit Excel Content")
@@ -619,40 +1259,24 @@ class DynamicPlot(QMainWindow):
         # Layout for dialog
         layout = QVBoxLayout()
 
-        # Create table widget to display the data
-        table_widget = QTableWidget()
-        num_rows = sheet.max_row
-        num_cols = sheet.max_column
-        table_widget.setRowCount(num_rows)
-        table_widget.setColumnCount(num_cols)
-
-        # Fill the table with Excel data
-        for row in range(num_rows):
-            for col in range(num_cols):
-                value = sheet.cell(row=row+1, column=col+1).value
-                item = QTableWidgetItem(str(value))
-
-                # Make the first row uneditable
-                if row == 0:  
-                    item.setFlags(item.flags() & ~Qt.Qt.ItemIsEditable)  
-                    item.setBackground(QColor("lightgrey"))  
-
-                table_widget.setItem(row, col, item)
+        # Create table view backed by the DataFrame, the column names are the header
+        table_view = QTableView()
+        table_view.setModel(PvTableModel(pv_list, table_view))
 
         # Add Save button to save the edited content back to the Excel file
         save_button = QPushButton("Save")
-        save_button.clicked.connect(lambda: self.save_table_data(table_widget, file_name))
+        save_button.clicked.connect(lambda: self.save_table_data(table_view, file_name))
 
         # Add Add Row button
         add_row_button = QPushButton("Add Row")
-        add_row_button.clicked.connect(lambda: self.add_row(table_widget))
+        add_row_button.clicked.connect(lambda: self.add_row(table_view))
 
         # Add Delete Row button
         delete_row_button = QPushButton("Delete Row")
-        delete_row_button.clicked.connect(lambda: self.delete_row(table_widget))
+        delete_row_button.clicked.connect(lambda: self.delete_row(table_view))
 
-        # Add table widget, Add Row button, Delete Row button, and Save button to the layout
-        layout.addWidget(table_widget)
+        # Add table view, Add Row button, Delete Row button, and Save button to the layout
+        layout.addWidget(table_view)
         layout.addWidget(add_row_button)
         layout.addWidget(delete_row_button)
         layout.addWidget(save_button)
@@ -661,46 +1285,34 @@ class DynamicPlot(QMainWindow):
 
         dialog.exec_()
 
-    def add_row(self, table_widget):
+    def add_row(self, table_view):
         """Add a new row to the table."""
-        row_position = table_widget.rowCount()
-        table_widget.insertRow(row_position)
-        # Optionally, set the cells of the new row to empty values
-        for col in range(table_widget.columnCount()):
-            table_widget.setItem(row_position, col, QTableWidgetItem(''))
+        model = table_view.model()
+        model.insertRows(model.rowCount(), 1)
 
-    def delete_row(self, table_widget):
+    def delete_row(self, table_view):
         """Delete the selected row from the table."""
-        selected_row = table_widget.currentRow()
+        selected_row = table_view.currentIndex().row()
         if selected_row >= 0:  # If a row is selected
-            table_widget.removeRow(selected_row)
+            table_view.model().removeRows(selected_row, 1)
         else:
             QMessageBox.warning(self, "No Row Selected", "Please select a row to delete.")
 
-    def save_table_data(self, table_widget, file_name):
+    def save_table_data(self, table_view, file_name):
         """Save the edited data from the table back to a new Excel file."""
+        pv_list = table_view.model().pv_list
+        errors = validate_pv_table(pv_list)
+        if errors:
+            QMessageBox.warning(self, "Invalid PV Table", "\n".join(errors))
+            return
         try:
-            num_rows = table_widget.rowCount()
-            num_cols = table_widget.columnCount()
-
-            # Create a new workbook and sheet
-            wb = openpyxl.Workbook()
-            sheet = wb.active
-
             # Write the table data to the new workbook
-            for row in range(num_rows):
-                for col in range(num_cols):
-                    item = table_widget.item(row, col)
-                    value = item.text() if item else ""  # Ensure no errors for empty cells
-                    sheet.cell(row=row + 1, column=col + 1, value=value)
-
-            # Save the new workbook to the specified file
-            wb.save(file_name)
-
-            # Reload the dropdowns to reflect changes
-            self.dropdown1.clear()
-            self.dropdown2.clear()
-            self.load_excel_data()
+            write_pv_table(pv_list, file_name)
+
+            # Update the dropdowns with the changed rows
+            if os.path.abspath(file_name) == os.path.abspath(PV_TABLE_FILE):
+                self.pvList = pv_list.copy()
+                self.refresh_pv_registry(self.pvList)
 
             QMessageBox.information(self, "Save Successful", f"Excel file saved successfully: {file_name}")
         except Exception as e:
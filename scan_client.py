@@ -0,0 +1,88 @@
+import sys
+import json
+import argparse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+# Address of the scan control server started by qt_1d_scan.py
+SERVER_URL = "http://127.0.0.1:5065"
+
+
+def submit_scan(definition, url=SERVER_URL):
+    """Queue a scan definition and return it with its scan id."""
+    request = Request(url + "/scans", data=json.dumps(definition).encode(),
+                      headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urlopen(request, timeout=5) as response:
+            return json.load(response)
+    except HTTPError as e:
+        raise ValueError(json.load(e).get("error", str(e)))
+
+
+def get_status(url=SERVER_URL):
+    """Return the current state, scan and queue length of the server."""
+    with urlopen(url + "/status", timeout=5) as response:
+        return json.load(response)
+
+
+def stream_events(since=0, follow=True, url=SERVER_URL):
+    """Yield the scan events (queued, started, point, fit, finished, error) as they arrive."""
+    with urlopen(url + "/events?since=%d&follow=%d" % (since, follow)) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+
+def run_scan(definition, url=SERVER_URL):
+    """Queue a scan, print its points and fits, and return the final event of the scan.
+
+    Returns None if the event stream closes before the scan finishes.
+    """
+    since = get_status(url).get("events", 0)
+    scan_id = submit_scan(definition, url)["id"]
+    for event in stream_events(since=since, url=url):
+        if event.get("id") != scan_id and event.get("scan", {}).get("id") != scan_id:
+            continue
+        print(json.dumps(event))
+        if event["event"] in ("finished", "error"):
+            return event
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in client for the scan control server.")
+    parser.add_argument("--url", default=SERVER_URL)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Queue a scan and follow it until it finishes")
+    scan_parser.add_argument("--motor", required=True)
+    scan_parser.add_argument("--detector", required=True)
+    scan_parser.add_argument("--start", type=float, required=True)
+    scan_parser.add_argument("--end", type=float, required=True)
+    scan_parser.add_argument("--num", type=int, required=True)
+    scan_parser.add_argument("--time", type=float, default=0.5)
+    scan_parser.add_argument("--repeats", type=int, default=1, help="Number of passes, alternating direction")
+    scan_parser.add_argument("--tolerance", type=float, default=0, help="Stop once the fitted centre error is below this")
+    scan_parser.add_argument("--triggered", action="store_true", help="Acquire by trigger and Done PVs of the detector")
+    scan_parser.add_argument("--fit", action="append", default=[], help="Fitting function, may be repeated")
+
+    subparsers.add_parser("status", help="Print the server status")
+    subparsers.add_parser("events", help="Print all events and follow new ones")
+
+    args = parser.parse_args()
+    if args.command == "scan":
+        definition = {"motor": args.motor, "detector": args.detector, "start": args.start, "end": args.end,
+                      "num": args.num, "time": args.time, "repeats": args.repeats, "tolerance": args.tolerance,
+                      "triggered": args.triggered, "fitting": args.fit}
+        try:
+            final = run_scan(definition, args.url)
+        except ValueError as e:
+            sys.exit(f"Scan rejected: {e}")
+        if final is None:
+            sys.exit("Event stream closed before the scan finished")
+        sys.exit(0 if final["event"] == "finished" else 1)
+    elif args.command == "status":
+        print(json.dumps(get_status(args.url), indent=4))
+    else:
+        for event in stream_events(url=args.url):
+            print(json.dumps(event))